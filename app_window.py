@@ -1,15 +1,19 @@
 
 import os
+import time
 
+from collections import deque
 from datetime import datetime
 
-from utils import load_stylesheet, resource_path
+from utils import load_stylesheet, resource_path, get_process_rss, get_peak_rss
 
 import rutt_to_qb
 from utils import load_stylesheet
 from config_manager import ConfigManager
 from ui_builder import UiBuilder
 from tray_manager import TrayManager
+from control_server import ControlServer
+from update_profiler import UpdateProfiler
 
 from PyQt6.QtWidgets import (
     QMainWindow, QFileDialog, QMessageBox, QTreeWidgetItem,
@@ -21,6 +25,7 @@ from PyQt6.QtCore import Qt, pyqtSlot, QEvent, QTimer
 
 class TorrentApp(QMainWindow):
     LOG_TRUNCATE_LENGTH = 100
+    LOG_HISTORY_LIMIT = 1000  # Сколько записей лога хранится, пока окно скрыто в трее
 
     def __init__(self):
         super().__init__()
@@ -30,10 +35,20 @@ class TorrentApp(QMainWindow):
         self.selected_path = ""
         self._is_quitting = False
 
+        # --- Состояние режима простоя в трее ---
+        self._idle_log = deque(maxlen=self.LOG_HISTORY_LIMIT)
+        self._idle_log_dropped = 0
+        self._tray_idle = False
+        self._torrent_list_dirty = False
+        self._idle_started = 0.0
+        self._idle_deferred_updates = 0
+        self._idle_cpu_started = 0.0
+
         # --- Инициализация компонентов ---
         self.config = ConfigManager()
         self.ui = UiBuilder(self)
         self.tray = TrayManager(self)
+        self.control = ControlServer(self)
 
         self.ui.setup_ui()
         self.apply_theme()
@@ -51,6 +66,8 @@ class TorrentApp(QMainWindow):
             self.error_label.setVisible(True)
             self.log_message("Приложение запущено с критической ошибкой.")
 
+        self.control.start()
+
     def _check_critical_dependencies(self):
         if not os.path.exists(rutt_to_qb.COOKIES_FILE):
             self.is_operational = False
@@ -117,6 +134,7 @@ class TorrentApp(QMainWindow):
         self.config.save()
 
         if self._is_quitting or not self.tray.is_enabled or not self.config.get('close_to_tray'):
+            self.control.stop()
             super().closeEvent(event)
             return
 
@@ -164,9 +182,81 @@ class TorrentApp(QMainWindow):
             self.path_label.setText(folder_path)
             self.log_message(f"Выбрана папка: {folder_path}")
 
+    # --- Tray Idle Mode ---
+    def enter_tray_idle(self):
+        """Освобождает содержимое списков и останавливает обновление UI, пока окно скрыто."""
+        if self._tray_idle or not self.config.get('tray_idle_mode'):
+            return
+        self._tray_idle = True
+        self._idle_started = time.monotonic()
+        self._idle_cpu_started = time.process_time()
+        self._idle_deferred_updates = 0
+        self.setUpdatesEnabled(False)
+        self._idle_log.clear()
+        self._idle_log_dropped = 0
+        for i in range(self.log_widget.topLevelItemCount()):
+            self._remember_log_entry(*self._log_entry_from_item(self.log_widget.topLevelItem(i)))
+        self.log_widget.clear()
+        self.torrent_list_widget.clear()
+        self._torrent_list_dirty = True
+
+    def leave_tray_idle(self):
+        """Пересобирает списки из сохранённых данных перед показом окна."""
+        if not self._tray_idle:
+            return
+        # Замеры до пересборки виджетов, чтобы отразить состояние простоя
+        idle_summary = self._idle_summary()
+        self._tray_idle = False
+        self.setUpdatesEnabled(True)
+        if self._idle_log_dropped:
+            self._add_log_item("", f"... {self._idle_log_dropped} более ранних записей лога не сохранено "
+                                   f"в режиме трея (лимит {self.LOG_HISTORY_LIMIT})")
+        for timestamp, message in self._idle_log:
+            self._add_log_item(timestamp, message)
+        self._idle_log.clear()
+        self.log_widget.scrollToBottom()
+        if self._torrent_list_dirty:
+            self.load_and_display_torrents()
+        self.log_message(idle_summary)
+
+    def _idle_summary(self) -> str:
+        hidden_for = time.monotonic() - self._idle_started
+        cpu_used = time.process_time() - self._idle_cpu_started
+        cpu_per_minute = cpu_used / hidden_for * 60 if hidden_for else 0.0
+
+        rss = get_process_rss()
+        if rss is not None:
+            memory = f"RSS перед восстановлением: {rss / 1024 / 1024:.1f} МБ"
+        else:
+            peak = get_peak_rss()
+            memory = f"пиковый RSS процесса: {peak / 1024 / 1024:.1f} МБ" if peak else "RSS: н/д"
+        return (
+            f"Режим трея: скрыто {hidden_for:.0f} с, процессорное время {cpu_used * 1000:.0f} мс "
+            f"({cpu_per_minute * 1000:.1f} мс/мин), отложено обновлений UI: {self._idle_deferred_updates}, {memory}."
+        )
+
+    def _remember_log_entry(self, timestamp: str, message: str):
+        if len(self._idle_log) == self._idle_log.maxlen:
+            self._idle_log_dropped += 1
+        self._idle_log.append((timestamp, message))
+
+    @staticmethod
+    def _log_entry_from_item(item: QTreeWidgetItem) -> tuple[str, str]:
+        # У длинных сообщений полный текст хранится в дочернем элементе
+        message = item.child(0).text(1) if item.childCount() else item.text(1)
+        return item.text(0), message
+
     # --- Core Logic Methods ---
     def log_message(self, message: str):
         timestamp = datetime.now().strftime('%H:%M:%S')
+        if self._tray_idle:
+            self._remember_log_entry(timestamp, message)
+            self._idle_deferred_updates += 1
+            return
+        self._add_log_item(timestamp, message)
+        self.log_widget.scrollToBottom()
+
+    def _add_log_item(self, timestamp: str, message: str):
         if len(message) > self.LOG_TRUNCATE_LENGTH:
             short_message = message[:self.LOG_TRUNCATE_LENGTH] + "... (нажмите, чтобы развернуть)"
             parent_item = QTreeWidgetItem(self.log_widget, [timestamp, short_message])
@@ -174,11 +264,15 @@ class TorrentApp(QMainWindow):
             child_item.setFont(1, QFont("Courier New", 9))
         else:
             QTreeWidgetItem(self.log_widget, [timestamp, message])
-        self.log_widget.scrollToBottom()
 
     @pyqtSlot()
     def load_and_display_torrents(self):
         if not self.is_operational: return
+        if self._tray_idle:
+            self._torrent_list_dirty = True
+            self._idle_deferred_updates += 1
+            return
+        self._torrent_list_dirty = False
         self.log_message("Загрузка списка отслеживаемых торрентов...")
         self.torrent_list_widget.clear()
         try:
@@ -243,10 +337,31 @@ class TorrentApp(QMainWindow):
 
     @pyqtSlot()
     def update_action(self):
+        request_budget = self.config.get('update_request_budget')
+        try:
+            rutt_to_qb.validate_request_budget(request_budget)
+        except ValueError as e:
+            self.log_message(f"Некорректная настройка update_request_budget в user-config.json: {e}")
+            QMessageBox.warning(self, "Ошибка настроек", f"update_request_budget: {e}")
+            return
         self.log_message("Запуск обновления всех торрентов...")
         try:
-            rutt_to_qb.update_torrents(self.log_message)
-            QMessageBox.information(self, "Успех", "Обновление торрентов завершено!")
+            summary = rutt_to_qb.update_torrents(
+                self.log_message,
+                time_budget=self.config.get('update_time_budget'),
+                request_budget=request_budget,
+                profiler=UpdateProfiler.from_settings(self.config)
+            )
+            if summary is None:
+                # Обновление уже выполняется (например, через Control API), нет раздач или недоступны куки
+                QMessageBox.warning(self, "Обновление", "Обновление не выполнено: оно уже выполняется, "
+                                                        "нет раздач или недоступны куки. Подробности в логах.")
+            elif summary['remaining']:
+                QMessageBox.information(self, "Успех",
+                                        f"Обновление завершено по бюджету. Перенесено на следующий запуск: "
+                                        f"{summary['remaining']}.")
+            else:
+                QMessageBox.information(self, "Успех", "Обновление торрентов завершено!")
         except Exception as e:
             self.log_message(f"Критическая ошибка при обновлении: {e}")
             QMessageBox.critical(self, "Ошибка", f"Произошла ошибка: {e}")
\ No newline at end of file
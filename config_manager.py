@@ -2,6 +2,8 @@ import json
 import os
 from typing import Any
 
+from update_profiler import UpdateProfiler
+
 class ConfigManager:
     USER_CONFIG_FILE = 'user-config.json'
     DEFAULT_USER_CONFIG = {
@@ -11,7 +13,21 @@ class ConfigManager:
         'minimize_to_tray': True,
         'close_to_tray': True,
         'show_tray_notifications': True,
-        'torrent_columns_width': [300, 100, 400]
+        'tray_idle_mode': True,
+        'torrent_columns_width': [300, 100, 400],
+        # Бюджет одного запуска обновления, 0 — без ограничений
+        'update_time_budget': 0,
+        'update_request_budget': 0,
+        # Локальный HTTP API (только 127.0.0.1), токен передается как 'Authorization: Bearer <token>'.
+        # Пустой токен генерируется при первом запуске API
+        'control_api_enabled': False,
+        'control_api_port': 8765,
+        'control_api_token': '',
+        # Профилирование обновлений (cProfile, .pstats файлы в profile_dir)
+        'profile_updates': False,
+        'profile_dir': UpdateProfiler.DEFAULT_DIR,
+        'profile_topic_threshold': UpdateProfiler.DEFAULT_THRESHOLD,
+        'profile_top_n': UpdateProfiler.DEFAULT_TOP_N
     }
 
     def __init__(self):
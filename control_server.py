@@ -0,0 +1,215 @@
+import json
+import secrets
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+
+import rutt_to_qb
+from update_profiler import UpdateProfiler
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class _ControlHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, controller: 'ControlServer'):
+        super().__init__(address, _ControlRequestHandler)
+        self.controller = controller
+
+
+class _ControlRequestHandler(BaseHTTPRequestHandler):
+    """Разбирает HTTP-запрос и передает его в ControlServer."""
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method: str):
+        controller = self.server.controller
+        # Защита от запросов со страниц в браузере и от DNS rebinding
+        port = self.server.server_address[1]
+        if self.headers.get('Host') not in (f'127.0.0.1:{port}', f'localhost:{port}'):
+            self._send_json(403, {'error': 'invalid Host header'})
+            return
+        if 'Origin' in self.headers:
+            self._send_json(403, {'error': 'browser requests are not allowed'})
+            return
+        if not controller.is_authorized(self.headers.get('Authorization', '')):
+            self._send_json(401, {'error': 'unauthorized'})
+            return
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if method == 'POST' and content_type != 'application/json':
+            self._send_json(415, {'error': 'Content-Type must be application/json'})
+            return
+
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        try:
+            body = self._read_json_body()
+        except ValueError as e:
+            self._send_json(400, {'error': f'invalid JSON: {e}'})
+            return
+
+        try:
+            status, payload = controller.handle(method, parts.path.rstrip('/') or '/', query, body)
+        except Exception as e:
+            controller.log_requested.emit(f"Control API: ошибка обработки {method} {parts.path}: {e}")
+            status, payload = 500, {'error': str(e)}
+        self._send_json(status, payload)
+
+    def _read_json_body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        data = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError("ожидается JSON-объект")
+        return data
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Логи доступа не нужны, события пишутся в лог приложения
+        pass
+
+
+class ControlServer(QObject):
+    """
+    Локальный HTTP API для управления запущенным приложением.
+    Работает в фоновом потоке и использует те же сессию, клиент qBittorrent и конфиг,
+    что и GUI. Обращения к виджетам передаются в главный поток через сигналы.
+    """
+    HOST = '127.0.0.1'
+
+    log_requested = pyqtSignal(str)
+    torrents_changed = pyqtSignal()
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+        self._server: Optional[_ControlHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.log_requested.connect(self.window.log_message)
+        self.torrents_changed.connect(self.window.load_and_display_torrents)
+
+    @property
+    def is_running(self) -> bool:
+        return self._server is not None
+
+    def start(self):
+        if self.is_running or not self.window.config.get('control_api_enabled'):
+            return
+        if not self.window.config.get('control_api_token'):
+            self.window.config.set('control_api_token', secrets.token_urlsafe(32))
+            self.window.config.save()
+            self.window.log_message("Для Control API сгенерирован токен, он сохранен в user-config.json "
+                                    "(control_api_token).")
+        port = self.window.config.get('control_api_port')
+        try:
+            self._server = _ControlHTTPServer((self.HOST, port), self)
+        except OSError as e:
+            self.window.log_message(f"Не удалось запустить Control API на порту {port}: {e}")
+            return
+        self._thread = threading.Thread(target=self._server.serve_forever, name="control-api", daemon=True)
+        self._thread.start()
+        self.window.log_message(f"Control API запущен: http://{self.HOST}:{port}/")
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=2)
+        self._server = None
+        self._thread = None
+
+    def is_authorized(self, header: str) -> bool:
+        token = self.window.config.get('control_api_token')
+        return bool(token) and secrets.compare_digest(header.encode('utf-8'), f"Bearer {token}".encode('utf-8'))
+
+    # --- Обработчики запросов (вызываются из потоков сервера) ---
+    def handle(self, method: str, path: str, query: dict, body: dict) -> tuple[int, dict]:
+        if method == 'GET' and path == '/status':
+            return 200, self._status()
+        if method == 'GET' and path == '/torrents':
+            return 200, self._list_torrents()
+        if method == 'POST' and path == '/torrents':
+            return self._add_torrent(body)
+        if method == 'DELETE' and path.startswith('/torrents/'):
+            delete_files = str(query.get('delete_files', '')).lower() in ('1', 'true', 'yes')
+            return self._delete_torrent(path.rsplit('/', 1)[-1], delete_files)
+        if method == 'POST' and path == '/update':
+            return self._start_update(body)
+        return 404, {'error': f'unknown endpoint: {method} {path}'}
+
+    def _status(self) -> dict:
+        config = rutt_to_qb.load_config(self.log_requested.emit)
+        return {
+            **rutt_to_qb.update_status,
+            'operational': self.window.is_operational,
+            'torrents': len(config['torrents']),
+            'pending': len(config.get(rutt_to_qb.PENDING_KEY, [])),
+        }
+
+    def _list_torrents(self) -> dict:
+        config = rutt_to_qb.load_config(self.log_requested.emit)
+        return {'torrents': [{'id': torrent_id, **settings} for torrent_id, settings in config['torrents'].items()]}
+
+    def _add_torrent(self, body: dict) -> tuple[int, dict]:
+        url, save_path = body.get('url'), body.get('save_path')
+        if not url or not save_path:
+            return 400, {'error': "требуются поля 'url' и 'save_path'"}
+        try:
+            torrent_id = rutt_to_qb.add_torrent_from_url(url, save_path, self.log_requested.emit)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        self.torrents_changed.emit()
+        return 201, {'id': torrent_id}
+
+    def _delete_torrent(self, torrent_id: str, delete_files: bool) -> tuple[int, dict]:
+        if torrent_id not in rutt_to_qb.load_config(self.log_requested.emit)['torrents']:
+            return 404, {'error': f'torrent {torrent_id} not found'}
+        rutt_to_qb.delete_torrent(torrent_id, delete_files, self.log_requested.emit)
+        self.torrents_changed.emit()
+        return 200, {'id': torrent_id, 'deleted': True}
+
+    def _start_update(self, body: dict) -> tuple[int, dict]:
+        if not self.window.is_operational:
+            return 503, {'error': f"файл {rutt_to_qb.COOKIES_FILE} не найден"}
+        try:
+            time_budget = self._parse_time_budget(body)
+            request_budget = body.get('request_budget')
+            if request_budget is None:
+                request_budget = self.window.config.get('update_request_budget')
+            rutt_to_qb.validate_request_budget(request_budget)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+        profiler = UpdateProfiler.from_settings(self.window.config)
+        if not rutt_to_qb.start_update_in_background(self.log_requested.emit, time_budget, request_budget, profiler):
+            return 409, {'error': 'update already running', **rutt_to_qb.update_status}
+        self.log_requested.emit("Обновление запущено через Control API.")
+        return 202, {'started': True}
+
+    def _parse_time_budget(self, body: dict) -> float:
+        value = body.get('time_budget')
+        if value is None:
+            return self.window.config.get('update_time_budget')
+        # bool — подкласс int, но как бюджет не подходит
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError("'time_budget' должен быть неотрицательным числом")
+        return value
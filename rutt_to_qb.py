@@ -1,10 +1,19 @@
 import re
 import os
+import copy
 import json
+import time
+import threading
+import heapq
+import hashlib
+import argparse
 import requests
+from contextlib import nullcontext
 from bs4 import BeautifulSoup
 from qbittorrentapi import Client, APIConnectionError, NotFound404Error
 
+from update_profiler import UpdateProfiler
+
 CONFIG_FILE = 'torrent_config.json'
 COOKIES_FILE = 'cookies.json'  # Имя файла остается константой
 
@@ -13,10 +22,32 @@ QB_HOST = 'localhost:8080'
 QB_USERNAME = 'admin'
 QB_PASSWORD = 'adminadmin'
 
+# Ключи планировщика обновлений в torrent_config.json
+PENDING_KEY = 'pending_updates'  # Раздачи, не успевшие обработаться в прошлый запуск
+CARRYOVER_BOOST = 2.0  # Во сколько раз повышается срочность раздач, перенесённых с прошлого запуска
+STATS_KEY = 'stats'  # Статистика проверок внутри записи раздачи
+REQUESTS_PER_TOPIC = 2  # Страница раздачи + .torrent файл
+MAX_FAILURE_BACKOFF = 5  # Максимальная степень понижения приоритета после неудач
+FAILURE_BACKOFF_PERIOD = 6 * 60 * 60  # За сколько секунд после неудачи понижение приоритета сходит на нет
+PRIOR_CHANGE_RATE = 0.1  # Априорная доля проверок с изменениями для раздач без истории
+
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
 }
 
+# --- Долгоживущие ресурсы, переиспользуемые между запусками ---
+_session = None
+_qb_client = None
+_resources_lock = threading.Lock()
+
+# Конфиг читается с диска только при изменении файла
+_config_lock = threading.RLock()
+_config_cache = {'key': None, 'data': None}
+
+# Одновременно может выполняться только один запуск обновления (GUI, трей или API)
+_update_lock = threading.Lock()
+update_status = {'running': False, 'started': None, 'finished': None, 'last_summary': None}
+
 
 # --- НОВАЯ ФУНКЦИЯ для загрузки куки ---
 def load_cookies(log_func=None):
@@ -37,6 +68,39 @@ def load_cookies(log_func=None):
         return None
 
 
+def _get_session():
+    """Возвращает общую HTTP-сессию для Rutracker (keep-alive соединения переиспользуются)."""
+    global _session
+    with _resources_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(headers)
+        return _session
+
+
+def _get_qb_client():
+    """Возвращает авторизованный клиент qBittorrent, создавая его при первом обращении."""
+    global _qb_client
+    with _resources_lock:
+        if _qb_client is None:
+            qb = Client(host=QB_HOST, username=QB_USERNAME, password=QB_PASSWORD)
+            qb.auth_log_in()
+            _qb_client = qb
+        return _qb_client
+
+
+def _reset_qb_client():
+    """Сбрасывает клиент qBittorrent после ошибки подключения, следующий вызов переподключится."""
+    global _qb_client
+    with _resources_lock:
+        _qb_client = None
+
+
+def is_update_running():
+    """Проверяет, выполняется ли сейчас обновление раздач."""
+    return _update_lock.locked()
+
+
 def _log(message, log_func=None):
     """Вспомогательная функция для логирования."""
     if log_func:
@@ -46,28 +110,51 @@ def _log(message, log_func=None):
 
 
 # (остальные функции load_config, save_config, extract_torrent_id, add_torrent_from_url без изменений)
+def _config_file_key():
+    stat = os.stat(CONFIG_FILE)
+    return stat.st_mtime_ns, stat.st_size
+
+
 def load_config(log_func=None):
-    """Загружает или создает конфигурационный файл"""
+    """Загружает или создает конфигурационный файл. Возвращает копию, которую можно изменять."""
+    with _config_lock:
+        return copy.deepcopy(_load_cached_config(log_func))
+
+
+def _load_cached_config(log_func=None):
+    """Возвращает общий кэшированный конфиг без копирования. Изменять его нельзя, вызывать под _config_lock."""
     if os.path.exists(CONFIG_FILE):
+        key = _config_file_key()
+        if _config_cache['key'] == key:
+            return _config_cache['data']
         try:
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                 content = f.read().strip()
                 if not content:
                     raise ValueError("Файл пустой")
-                return json.loads(content)
+                config = json.loads(content)
+            _config_cache.update(key=key, data=config)
+            return config
         except (json.JSONDecodeError, ValueError) as e:
             _log(f"Повреждённый конфиг ({e}), пересоздаём...", log_func)
             os.remove(CONFIG_FILE)
 
-    config = {"torrents": {}}
-    save_config(config)
-    return config
+    save_config({"torrents": {}})
+    return _config_cache['data']
+
+
+def _is_tracked(torrent_id, log_func=None):
+    """Проверяет, что раздача всё ещё есть в конфиге (её могли удалить во время обновления)."""
+    with _config_lock:
+        return torrent_id in _load_cached_config(log_func)['torrents']
 
 
 def save_config(config):
     """Сохраняет конфигурацию в файл"""
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
+    with _config_lock:
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+        _config_cache.update(key=_config_file_key(), data=copy.deepcopy(config))
 
 
 def extract_torrent_id(url):
@@ -82,15 +169,18 @@ def add_torrent_from_url(topic_url, save_path, log_func=None):
     """Добавляет новую раздачу по ссылке"""
     try:
         torrent_id = extract_torrent_id(topic_url)
-        config = load_config(log_func)
-        if torrent_id in config['torrents']:
-            _log(f"Торрент с ID {torrent_id} уже есть в конфиге. Обновляем путь.", log_func)
-        config['torrents'][torrent_id] = {"save_path": save_path, "url": topic_url}
-        save_config(config)
+        with _config_lock:
+            config = load_config(log_func)
+            if torrent_id in config['torrents']:
+                _log(f"Торрент с ID {torrent_id} уже есть в конфиге. Обновляем путь.", log_func)
+            # Статистику проверок сохраняем, меняются только путь и ссылка
+            config['torrents'].setdefault(torrent_id, {}).update(save_path=save_path, url=topic_url)
+            save_config(config)
         _log(f"Добавлена новая раздача в конфиг: ID {torrent_id}, путь: {save_path}", log_func)
     except ValueError as e:
         _log(f"Ошибка при добавлении торрента: {e}", log_func)
         raise
+    return torrent_id
 
 
 # --- ИЗМЕНЕННЫЕ ФУНКЦИИ, использующие load_cookies ---
@@ -104,9 +194,10 @@ def download_torrent(torrent_id, log_func=None):
     base_url = "https://rutracker.org/forum/"
     topic_url = f"viewtopic.php?t={torrent_id}"
 
+    session = _get_session()
     _log(f"Загрузка страницы для ID {torrent_id}...", log_func)
     try:
-        response = requests.get(base_url + topic_url, cookies=cookies, headers=headers, timeout=15)
+        response = session.get(base_url + topic_url, cookies=cookies, timeout=15)
         response.raise_for_status()
     except requests.RequestException as e:
         _log(f"Ошибка загрузки страницы {topic_url}: {e}", log_func)
@@ -121,7 +212,7 @@ def download_torrent(torrent_id, log_func=None):
     torrent_download_url = base_url + dl_link['href']
     _log(f"Загрузка .torrent файла с {torrent_download_url}", log_func)
     try:
-        torrent_response = requests.get(torrent_download_url, cookies=cookies, headers=headers, timeout=15)
+        torrent_response = session.get(torrent_download_url, cookies=cookies, timeout=15)
         torrent_response.raise_for_status()
     except requests.RequestException as e:
         _log(f"Ошибка загрузки .torrent файла: {e}", log_func)
@@ -134,9 +225,7 @@ def add_to_qbittorrent(torrent_content, save_path, original_url, log_func=None):
     """Добавляет торрент в qBittorrent, добавляя URL в комментарий."""
     # Эта функция не зависит от куки, оставляем как есть
     try:
-        qb = Client(host=QB_HOST, username=QB_USERNAME, password=QB_PASSWORD)
-        qb.auth_log_in()
-        _log(f"Подключен к qBittorrent: {qb.app.version}", log_func)
+        qb = _get_qb_client()
 
         result = qb.torrents_add(
             torrent_files=torrent_content,
@@ -146,36 +235,233 @@ def add_to_qbittorrent(torrent_content, save_path, original_url, log_func=None):
         _log(f"Задание на добавление торрента в qBittorrent отправлено. Результат: {result}", log_func)
         return True
     except APIConnectionError as e:
+        _reset_qb_client()
         _log(f"Ошибка подключения к qBittorrent: {e}. Проверьте хост, порт, логин и пароль.", log_func)
     except Exception as e:
         _log(f"Ошибка при добавлении в qBittorrent: {e}", log_func)
     return False
 
 
-def update_torrents(log_func=None):
-    """Обновляет все раздачи из конфига"""
+def _topic_priority(stats, now):
+    """
+    Вычисляет срочность проверки раздачи: чем больше значение, тем раньше она обработается.
+    Учитывает частоту изменений, время с последней проверки и недавние неудачи.
+    """
+    last_checked = stats.get('last_checked')
+    if last_checked is None:
+        return float('inf')  # Ни разу не проверялась — в начало очереди
+
+    elapsed = max(now - last_checked, 0)
+    # Слабое априорное значение: раздачи без изменений не получают нулевую частоту,
+    # но быстро уступают тем, что реально меняются
+    change_rate = (stats.get('changes', 0) + PRIOR_CHANGE_RATE) / (stats.get('checks', 0) + 1)
+    urgency = elapsed * change_rate
+
+    fail_streak = stats.get('fail_streak', 0)
+    last_failure = stats.get('last_failure')
+    if fail_streak and last_failure is not None:
+        # Понижение максимально сразу после неудачи и линейно ослабевает за FAILURE_BACKOFF_PERIOD
+        fade = max(0.0, 1 - (now - last_failure) / FAILURE_BACKOFF_PERIOD)
+        urgency /= 1 + (2 ** min(fail_streak, MAX_FAILURE_BACKOFF) - 1) * fade
+    return urgency
+
+
+def _build_update_queue(config, now):
+    """
+    Формирует порядок обработки по убыванию срочности.
+    Раздачи, перенесённые с прошлого запуска, получают ограниченную надбавку CARRYOVER_BOOST,
+    но не обгоняют безусловно часто меняющиеся раздачи.
+    """
+    carried_over = set(config.get(PENDING_KEY, []))
+    heap = []
+    for torrent_id, settings in config['torrents'].items():
+        urgency = _topic_priority(settings.get(STATS_KEY, {}), now)
+        if torrent_id in carried_over:
+            urgency *= CARRYOVER_BOOST
+        heap.append((-urgency, torrent_id))
+    heapq.heapify(heap)
+    return [heapq.heappop(heap)[1] for _ in range(len(heap))]
+
+
+def _record_check(settings, now, torrent_content=None):
+    """Обновляет статистику раздачи после проверки. torrent_content=None означает неудачу."""
+    stats = settings.setdefault(STATS_KEY, {})
+    stats['last_checked'] = now
+    stats['checks'] = stats.get('checks', 0) + 1
+
+    if torrent_content is None:
+        stats['last_failure'] = now
+        stats['fail_streak'] = stats.get('fail_streak', 0) + 1
+        return False
+
+    stats['fail_streak'] = 0
+    content_hash = hashlib.sha1(torrent_content).hexdigest()
+    changed = stats.get('content_hash') not in (None, content_hash)
+    if changed:
+        stats['changes'] = stats.get('changes', 0) + 1
+        stats['last_changed'] = now
+    stats['content_hash'] = content_hash
+    return changed
+
+
+def validate_request_budget(request_budget):
+    """
+    Проверяет бюджет запросов: None или 0 — без ограничений, иначе целое число
+    не меньше REQUESTS_PER_TOPIC, чтобы за запуск обрабатывалась хотя бы одна раздача.
+    """
+    if request_budget is None:
+        return None
+    is_int = isinstance(request_budget, int) and not isinstance(request_budget, bool)
+    if not is_int or not (request_budget == 0 or request_budget >= REQUESTS_PER_TOPIC):
+        raise ValueError(f"Бюджет запросов должен быть 0 (без ограничений) или целым числом "
+                         f"не меньше {REQUESTS_PER_TOPIC}, получено: {request_budget!r}")
+    return request_budget
+
+
+def update_torrents(log_func=None, time_budget=None, request_budget=None, profiler=None):
+    """
+    Обновляет раздачи из конфига в порядке приоритета.
+
+    time_budget — ограничение длительности запуска в секундах,
+    request_budget — ограничение числа запросов к Rutracker.
+    Раздачи, не уместившиеся в бюджет, переносятся на следующий запуск.
+    profiler — UpdateProfiler для записи профилей запуска и медленных раздач.
+    Возвращает словарь с итогами запуска или None, если обновление не выполнялось.
+    Некорректный request_budget приводит к ValueError (см. validate_request_budget).
+    """
+    validate_request_budget(request_budget)
+    if not _begin_update():
+        _log("Обновление уже выполняется, повторный запуск пропущен.", log_func)
+        return None
+    return _run_locked_update(log_func, time_budget, request_budget, profiler)
+
+
+def start_update_in_background(log_func=None, time_budget=None, request_budget=None, profiler=None):
+    """
+    Запускает update_torrents в фоновом потоке.
+    Возвращает False, если обновление уже выполняется (проверка и запуск атомарны).
+    """
+    validate_request_budget(request_budget)
+    if not _begin_update():
+        return False
+    try:
+        threading.Thread(target=_run_locked_update, args=(log_func, time_budget, request_budget, profiler),
+                         name="update-torrents", daemon=True).start()
+    except Exception:
+        _end_update()
+        raise
+    return True
+
+
+def _begin_update():
+    if not _update_lock.acquire(blocking=False):
+        return False
+    update_status.update(running=True, started=time.time(), finished=None)
+    return True
+
+
+def _end_update():
+    update_status.update(running=False, finished=time.time())
+    _update_lock.release()
+
+
+def _run_locked_update(log_func, time_budget, request_budget, profiler):
+    """Выполняет обновление при захваченной _update_lock и освобождает её по завершении."""
+    try:
+        if profiler:
+            profiler.start_run()
+        summary = _run_update(log_func, time_budget, request_budget, profiler)
+        update_status['last_summary'] = summary
+        return summary
+    finally:
+        try:
+            if profiler:
+                profiler.finish_run(log_func)
+        finally:
+            _end_update()
+
+
+def _run_update(log_func, time_budget, request_budget, profiler=None):
     config = load_config(log_func)
     if not config['torrents']:
         _log("В конфиге нет торрентов для обновления.", log_func)
-        return
+        return None
 
     # Проверим куки один раз в начале
     if not load_cookies(log_func):
         _log("Обновление невозможно: файл с куки отсутствует или поврежден.", log_func)
-        return
+        return None
 
-    for torrent_id, settings in config['torrents'].items():
-        _log(f"\n--- Обработка раздачи ID: {torrent_id} ---", log_func)
-
-        download_result = download_torrent(torrent_id, log_func)
-        if download_result:
-            torrent_content, original_url = download_result
-            if add_to_qbittorrent(torrent_content, settings['save_path'], original_url, log_func):
-                _log(f"Раздача {torrent_id} успешно отправлена на обновление в qBittorrent.", log_func)
-            else:
-                _log(f"Не удалось обновить раздачу {torrent_id} в qBittorrent.", log_func)
+    started = time.monotonic()
+    queue = _build_update_queue(config, time.time())
+    summary = {'processed': 0, 'updated': 0, 'changed': 0, 'failed': 0, 'remaining': 0}
+    requests_used = 0
+    position = 0
+
+    try:
+        for torrent_id in queue:
+            if time_budget and time.monotonic() - started >= time_budget:
+                _log(f"Исчерпан бюджет времени ({time_budget} с).", log_func)
+                break
+            if request_budget and requests_used + REQUESTS_PER_TOPIC > request_budget:
+                _log(f"Исчерпан бюджет запросов ({request_budget}).", log_func)
+                break
+
+            if not _is_tracked(torrent_id, log_func):
+                _log(f"Раздача {torrent_id} удалена из конфига во время обновления, пропускаем.", log_func)
+                position += 1
+                continue
+
+            requests_used += REQUESTS_PER_TOPIC
+            summary['processed'] += 1
+            with profiler.topic(torrent_id, log_func) if profiler else nullcontext():
+                _process_topic(torrent_id, config['torrents'][torrent_id], summary, log_func)
+            # Раздача считается обработанной только после успешного завершения,
+            # иначе при исключении она остается в очереди на следующий запуск
+            position += 1
+    finally:
+        remaining = queue[position:]
+        config[PENDING_KEY] = remaining
+        summary['remaining'] = len(remaining)
+        _save_update_state(config, log_func)
+
+    if remaining:
+        _log(f"Обработано {summary['processed']} раздач, {len(remaining)} перенесено на следующий запуск.", log_func)
+    return summary
+
+
+def _process_topic(torrent_id, settings, summary, log_func=None):
+    """Скачивает .torrent файл раздачи и отправляет его в qBittorrent, обновляя итоги запуска."""
+    _log(f"\n--- Обработка раздачи ID: {torrent_id} ---", log_func)
+
+    download_result = download_torrent(torrent_id, log_func)
+    if download_result:
+        torrent_content, original_url = download_result
+        if _record_check(settings, time.time(), torrent_content):
+            summary['changed'] += 1
+            _log(f"Обнаружено изменение .torrent файла раздачи {torrent_id}.", log_func)
+        if add_to_qbittorrent(torrent_content, settings['save_path'], original_url, log_func):
+            summary['updated'] += 1
+            _log(f"Раздача {torrent_id} успешно отправлена на обновление в qBittorrent.", log_func)
         else:
-            _log(f"Не удалось скачать .torrent файл для раздачи {torrent_id}, обновление пропущено.", log_func)
+            summary['failed'] += 1
+            _log(f"Не удалось обновить раздачу {torrent_id} в qBittorrent.", log_func)
+    else:
+        _record_check(settings, time.time())
+        summary['failed'] += 1
+        _log(f"Не удалось скачать .torrent файл для раздачи {torrent_id}, обновление пропущено.", log_func)
+
+
+def _save_update_state(run_config, log_func=None):
+    """Сохраняет статистику и очередь запуска, не затирая изменения конфига, сделанные во время обновления."""
+    with _config_lock:
+        config = load_config(log_func)
+        for torrent_id, settings in config['torrents'].items():
+            run_settings = run_config['torrents'].get(torrent_id)
+            if run_settings and STATS_KEY in run_settings:
+                settings[STATS_KEY] = run_settings[STATS_KEY]
+        config[PENDING_KEY] = [tid for tid in run_config.get(PENDING_KEY, []) if tid in config['torrents']]
+        save_config(config)
 
 
 def delete_torrent(torrent_id, delete_files, log_func=None):
@@ -191,8 +477,7 @@ def delete_torrent(torrent_id, delete_files, log_func=None):
         return True
 
     try:
-        qb = Client(host=QB_HOST, username=QB_USERNAME, password=QB_PASSWORD)
-        qb.auth_log_in()
+        qb = _get_qb_client()
 
         found_hash = None
         _log("Поиск торрента в qBittorrent клиенте...", log_func)
@@ -209,18 +494,44 @@ def delete_torrent(torrent_id, delete_files, log_func=None):
             _log(f"Торрент с ID {torrent_id} не найден в qBittorrent. Возможно, он был удален ранее.", log_func)
 
     except APIConnectionError as e:
+        _reset_qb_client()
         _log(f"Не удалось подключиться к qBittorrent для удаления: {e}. Пропускаем этот шаг.", log_func)
     except NotFound404Error:
         _log(f"Торрент уже был удален из qBittorrent (ошибка 404).", log_func)
     except Exception as e:
         _log(f"Произошла ошибка при удалении из qBittorrent: {e}", log_func)
 
-    config = load_config(log_func)
-    if str(torrent_id) in config['torrents']:
-        del config['torrents'][str(torrent_id)]
-        save_config(config)
-        _log(f"Торрент с ID {torrent_id} удален из файла конфигурации.", log_func)
-    else:
-        _log(f"Торрент с ID {torrent_id} уже был удален из файла конфигурации.", log_func)
+    with _config_lock:
+        config = load_config(log_func)
+        if str(torrent_id) in config['torrents']:
+            del config['torrents'][str(torrent_id)]
+            save_config(config)
+            _log(f"Торрент с ID {torrent_id} удален из файла конфигурации.", log_func)
+        else:
+            _log(f"Торрент с ID {torrent_id} уже был удален из файла конфигурации.", log_func)
+
+    return True
+
+
+def main():
+    """Запуск обновления из командной строки, без GUI."""
+    parser = argparse.ArgumentParser(description="Обновление раздач Rutracker в qBittorrent")
+    parser.add_argument('--time-budget', type=float, help="ограничение длительности запуска, секунды")
+    parser.add_argument('--request-budget', type=int, help="ограничение числа запросов к Rutracker")
+    parser.add_argument('--profile', action='store_true', help="записать профиль cProfile запуска")
+    parser.add_argument('--profile-dir', default=UpdateProfiler.DEFAULT_DIR, help="папка для .pstats файлов")
+    parser.add_argument('--profile-threshold', type=float, default=UpdateProfiler.DEFAULT_THRESHOLD,
+                        help="отдельный профиль для раздач дольше этого числа секунд")
+    parser.add_argument('--profile-top', type=int, default=UpdateProfiler.DEFAULT_TOP_N, help="число функций в сводке")
+    args = parser.parse_args()
+    try:
+        validate_request_budget(args.request_budget)
+    except ValueError as e:
+        parser.error(str(e))
+
+    profiler = UpdateProfiler(args.profile_dir, args.profile_threshold, args.profile_top) if args.profile else None
+    update_torrents(time_budget=args.time_budget, request_budget=args.request_budget, profiler=profiler)
+
 
-    return True
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import http.client
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QObject
+
+import rutt_to_qb
+from control_server import ControlServer
+
+TOKEN = 'test-token'
+
+
+class _FakeConfig(dict):
+    def set(self, key, value):
+        self[key] = value
+
+    def save(self):
+        pass
+
+
+class _FakeWindow(QObject):
+    """Минимальная замена TorrentApp: ControlServer обращается только к этим атрибутам."""
+    is_operational = True
+
+    def __init__(self):
+        super().__init__()
+        self.config = _FakeConfig(control_api_enabled=True, control_api_port=0, control_api_token=TOKEN,
+                                  update_time_budget=0, update_request_budget=0)
+        self.messages = []
+
+    def log_message(self, message):
+        self.messages.append(message)
+
+    def load_and_display_torrents(self):
+        pass
+
+
+class ControlServerTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cookies_file = os.path.join(tmp.name, 'cookies.json')
+        with open(cookies_file, 'w', encoding='utf-8') as f:
+            f.write('{"bb_session": "value"}')
+        for name, value in (('CONFIG_FILE', os.path.join(tmp.name, 'torrent_config.json')),
+                            ('COOKIES_FILE', cookies_file)):
+            patcher = mock.patch.object(rutt_to_qb, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        rutt_to_qb._config_cache.update(key=None, data=None)
+        rutt_to_qb.save_config({'torrents': {'1': {'save_path': '/downloads', 'url': 'u'}}})
+
+        self.window = _FakeWindow()
+        self.server = ControlServer(self.window)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.assertTrue(self.server.is_running, self.window.messages)
+        self.port = self.server._server.server_address[1]
+
+    def request(self, method, path, body=None, **headers):
+        request_headers = {
+            'Host': f'127.0.0.1:{self.port}',
+            'Authorization': f'Bearer {TOKEN}',
+            'Content-Type': 'application/json',
+        }
+        request_headers.update({key.replace('_', '-'): value for key, value in headers.items()})
+        request_headers = {key: value for key, value in request_headers.items() if value is not None}
+
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        self.addCleanup(connection.close)
+        data = json.dumps(body) if body is not None else None
+        connection.request(method, path, body=data, headers=request_headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    # --- Проверки безопасности ---
+    def test_wrong_host_is_rejected(self):
+        status, _ = self.request('GET', '/status', Host=f'evil.example:{self.port}')
+        self.assertEqual(status, 403)
+
+    def test_localhost_host_is_accepted(self):
+        status, _ = self.request('GET', '/status', Host=f'localhost:{self.port}')
+        self.assertEqual(status, 200)
+
+    def test_request_with_origin_is_rejected(self):
+        status, _ = self.request('POST', '/update', {}, Origin='http://evil.example')
+        self.assertEqual(status, 403)
+
+    def test_missing_token_is_rejected(self):
+        status, _ = self.request('GET', '/torrents', Authorization=None)
+        self.assertEqual(status, 401)
+
+    def test_wrong_token_is_rejected(self):
+        status, _ = self.request('GET', '/torrents', Authorization='Bearer wrong')
+        self.assertEqual(status, 401)
+
+    def test_post_without_json_content_type_is_rejected(self):
+        body = {'url': 'https://rutracker.org/forum/viewtopic.php?t=2', 'save_path': '/downloads'}
+        status, _ = self.request('POST', '/torrents', body, Content_Type='text/plain')
+        self.assertEqual(status, 415)
+        self.assertNotIn('2', rutt_to_qb.load_config()['torrents'])
+
+    # --- Маршрутизация ---
+    def test_list_torrents(self):
+        status, payload = self.request('GET', '/torrents')
+        self.assertEqual(status, 200)
+        self.assertEqual([torrent['id'] for torrent in payload['torrents']], ['1'])
+
+    def test_add_torrent(self):
+        body = {'url': 'https://rutracker.org/forum/viewtopic.php?t=2', 'save_path': '/downloads'}
+        status, payload = self.request('POST', '/torrents', body)
+        self.assertEqual((status, payload), (201, {'id': '2'}))
+        self.assertIn('2', rutt_to_qb.load_config()['torrents'])
+
+    def test_unknown_endpoint(self):
+        status, _ = self.request('GET', '/nope')
+        self.assertEqual(status, 404)
+
+    def test_update_while_running_returns_conflict(self):
+        self.assertTrue(rutt_to_qb._begin_update())
+        try:
+            status, payload = self.request('POST', '/update', {})
+        finally:
+            rutt_to_qb._end_update()
+        self.assertEqual(status, 409)
+        self.assertTrue(payload['running'])
+
+    def test_update_with_invalid_request_budget(self):
+        for budget in (0.5, 1, '6'):
+            with self.subTest(budget=budget):
+                status, _ = self.request('POST', '/update', {'request_budget': budget})
+                self.assertEqual(status, 400)
+        self.assertFalse(rutt_to_qb.is_update_running())
+
+
+if __name__ == '__main__':
+    unittest.main()
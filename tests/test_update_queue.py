@@ -0,0 +1,126 @@
+import os
+import sys
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rutt_to_qb
+from rutt_to_qb import REQUESTS_PER_TOPIC
+
+
+class TopicPriorityTest(unittest.TestCase):
+    NOW = 1_000_000.0
+
+    def _stats(self, **extra):
+        return {'last_checked': self.NOW - 3600, 'checks': 4, 'changes': 2, **extra}
+
+    def test_recent_failure_lowers_priority(self):
+        healthy = rutt_to_qb._topic_priority(self._stats(), self.NOW)
+        failed = rutt_to_qb._topic_priority(self._stats(fail_streak=2, last_failure=self.NOW - 60), self.NOW)
+        self.assertLess(failed, healthy)
+
+    def test_failure_backoff_fades_with_time(self):
+        def priority(seconds_since_failure):
+            stats = self._stats(fail_streak=3, last_failure=self.NOW - seconds_since_failure)
+            return rutt_to_qb._topic_priority(stats, self.NOW)
+
+        period = rutt_to_qb.FAILURE_BACKOFF_PERIOD
+        self.assertLess(priority(60), priority(period / 2))
+        self.assertEqual(priority(period), rutt_to_qb._topic_priority(self._stats(), self.NOW))
+
+
+class BudgetedUpdateQueueTest(unittest.TestCase):
+    TOPICS = 10
+    RUNS = 8
+    RUN_INTERVAL = 600  # Секунд между запусками по расписанию
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cookies_file = os.path.join(tmp.name, 'cookies.json')
+        with open(cookies_file, 'w', encoding='utf-8') as f:
+            f.write('{"bb_session": "value"}')
+
+        for name, value in (('CONFIG_FILE', os.path.join(tmp.name, 'torrent_config.json')),
+                            ('COOKIES_FILE', cookies_file)):
+            patcher = mock.patch.object(rutt_to_qb, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        rutt_to_qb._config_cache.update(key=None, data=None)
+
+        rutt_to_qb.save_config({'torrents': {
+            str(i): {'save_path': '/downloads', 'url': f'https://rutracker.org/forum/viewtopic.php?t={i}'}
+            for i in range(self.TOPICS)
+        }})
+        self.checks = Counter()
+        self.clock = 1_000_000.0
+
+    def _download(self, torrent_id, log_func=None):
+        self.checks[torrent_id] += 1
+        # Раздача '0' меняется при каждой проверке, остальные не меняются
+        version = self.checks[torrent_id] if torrent_id == '0' else 0
+        return f'{torrent_id}:{version}'.encode(), f'url-{torrent_id}'
+
+    def _run_scheduled(self, **budget):
+        with mock.patch.object(rutt_to_qb, 'download_torrent', self._download), \
+                mock.patch.object(rutt_to_qb, 'add_to_qbittorrent', return_value=True), \
+                mock.patch.object(rutt_to_qb.time, 'time', side_effect=lambda: self.clock):
+            for _ in range(self.RUNS):
+                rutt_to_qb.update_torrents(lambda message: None, **budget)
+                self.clock += self.RUN_INTERVAL
+
+    def test_frequently_changing_topic_goes_first_across_budgeted_runs(self):
+        self._run_scheduled(request_budget=3 * rutt_to_qb.REQUESTS_PER_TOPIC)
+
+        hot_checks = self.checks.pop('0')
+        self.assertGreater(hot_checks, max(self.checks.values()))
+        # После первичного обхода всех раздач горячая проверяется почти в каждом запуске
+        self.assertGreaterEqual(hot_checks, self.RUNS - 2)
+
+    def test_dormant_topics_are_not_starved(self):
+        self._run_scheduled(request_budget=3 * rutt_to_qb.REQUESTS_PER_TOPIC)
+
+        self.assertEqual(set(self.checks), {str(i) for i in range(self.TOPICS)})
+
+    def test_unbudgeted_run_processes_everything(self):
+        self.RUNS = 1
+        self._run_scheduled()
+
+        self.assertEqual(sum(self.checks.values()), self.TOPICS)
+        self.assertEqual(rutt_to_qb.load_config()[rutt_to_qb.PENDING_KEY], [])
+
+    def test_request_budget_below_one_topic_is_rejected(self):
+        for budget in (1, REQUESTS_PER_TOPIC - 1, -2, 2.5, True, '6'):
+            with self.subTest(budget=budget), self.assertRaises(ValueError):
+                rutt_to_qb.update_torrents(lambda message: None, request_budget=budget)
+        self.assertFalse(rutt_to_qb.is_update_running())
+        self.assertEqual(sum(self.checks.values()), 0)
+
+    def test_minimal_request_budget_makes_progress(self):
+        self.RUNS = self.TOPICS
+        self._run_scheduled(request_budget=REQUESTS_PER_TOPIC)
+
+        self.assertEqual(set(self.checks), {str(i) for i in range(self.TOPICS)})
+
+    def test_topic_that_raises_stays_pending(self):
+        def download(torrent_id, log_func=None):
+            if torrent_id == '3':
+                raise RuntimeError("unexpected parser error")
+            return self._download(torrent_id, log_func)
+
+        with mock.patch.object(rutt_to_qb, 'download_torrent', download), \
+                mock.patch.object(rutt_to_qb, 'add_to_qbittorrent', return_value=True):
+            with self.assertRaises(RuntimeError):
+                rutt_to_qb.update_torrents(lambda message: None)
+
+        pending = rutt_to_qb.load_config()[rutt_to_qb.PENDING_KEY]
+        self.assertIn('3', pending)
+        self.assertEqual(len(pending) + sum(self.checks.values()), self.TOPICS)
+        self.assertFalse(rutt_to_qb.is_update_running())
+
+
+if __name__ == '__main__':
+    unittest.main()
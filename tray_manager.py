@@ -54,6 +54,7 @@ class TrayManager:
         if not self.is_enabled or not self.tray_icon:
             return
         self.window.hide()
+        self.window.enter_tray_idle()
         if self.window.config.get('show_tray_notifications', True) and not self._tray_message_shown:
             try:
                 self.tray_icon.showMessage("Torrent Manager", reason,
@@ -64,6 +65,7 @@ class TrayManager:
 
     def restore_from_tray(self):
         """Восстановить окно из трея."""
+        self.window.leave_tray_idle()
         self.window.showNormal()
         self.window.activateWindow()
         self.window.raise_()
@@ -0,0 +1,117 @@
+import os
+import time
+import itertools
+import cProfile
+import pstats
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+
+class UpdateProfiler:
+    """
+    Профилирование запуска update_torrents через cProfile.
+
+    Пишет .pstats файл для всего запуска и отдельные файлы для раздач, обработка которых
+    заняла больше threshold секунд. Файлы открываются в snakeviz и конвертируются
+    во flamegraph (flameprof, gprof2dot). Краткая сводка горячих функций выводится в лог.
+    """
+    DEFAULT_DIR = 'profiles'
+    DEFAULT_THRESHOLD = 10.0  # Секунды, после которых раздача получает отдельный профиль
+    DEFAULT_TOP_N = 15  # Число функций в сводке для лога
+    _run_counter = itertools.count(1)  # Различает запуски, начатые в одну и ту же миллисекунду
+
+    def __init__(self, output_dir: str = DEFAULT_DIR, threshold: float = DEFAULT_THRESHOLD,
+                 top_n: int = DEFAULT_TOP_N):
+        self.output_dir = output_dir
+        self.threshold = threshold
+        self.top_n = top_n
+        self._run_profile: Optional[cProfile.Profile] = None
+        self._topics_stats: Optional[pstats.Stats] = None
+        self._run_label = ""
+        self._slow_topics: list[tuple[str, float]] = []
+
+    @classmethod
+    def from_settings(cls, config) -> Optional['UpdateProfiler']:
+        """Создает профайлер по настройкам пользователя или возвращает None, если профилирование выключено."""
+        if not config.get('profile_updates'):
+            return None
+        return cls(config.get('profile_dir', cls.DEFAULT_DIR),
+                   config.get('profile_topic_threshold', cls.DEFAULT_THRESHOLD),
+                   config.get('profile_top_n', cls.DEFAULT_TOP_N))
+
+    def start_run(self):
+        self._run_label = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]}-{next(self._run_counter)}"
+        self._topics_stats = None
+        self._slow_topics = []
+        self._run_profile = cProfile.Profile()
+        self._run_profile.enable()
+
+    @contextmanager
+    def topic(self, torrent_id: str, log_func=None):
+        """Профилирует обработку одной раздачи отдельно от остального запуска."""
+        # Одновременно может быть активен только один cProfile, поэтому общий профиль на время приостанавливается
+        self._run_profile.disable()
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            topic_stats = pstats.Stats(profile)
+            if elapsed >= self.threshold:
+                self._slow_topics.append((torrent_id, elapsed))
+                path = self._dump(topic_stats, f"topic-{torrent_id}", log_func)
+                self._log(f"Раздача {torrent_id} обрабатывалась {elapsed:.1f} с (порог {self.threshold} с), "
+                          f"профиль: {path or 'не сохранен'}\n{self.summary(topic_stats)}", log_func)
+            # Сводная статистика копится сразу, отдельные профили раздач не хранятся
+            if self._topics_stats is None:
+                self._topics_stats = topic_stats
+            else:
+                self._topics_stats.add(topic_stats)
+            self._run_profile.enable()
+
+    def finish_run(self, log_func=None):
+        if self._run_profile is None:
+            return
+        self._run_profile.disable()
+        stats = pstats.Stats(self._run_profile)
+        if self._topics_stats is not None:
+            stats.add(self._topics_stats)
+        path = self._dump(stats, "run", log_func) or "не сохранен"
+        slow = ", ".join(f"{tid} ({elapsed:.1f} с)" for tid, elapsed in self._slow_topics) or "нет"
+        self._log(f"Профиль запуска обновления: {path}. Медленные раздачи: {slow}\n"
+                  f"{self.summary(stats)}", log_func)
+        self._run_profile = None
+        self._topics_stats = None
+
+    def summary(self, profile) -> str:
+        """Возвращает топ функций по собственному времени в компактном виде."""
+        stats = profile if isinstance(profile, pstats.Stats) else pstats.Stats(profile)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top_n]
+        lines = [f"Топ-{self.top_n} по собственному времени (tottime / cumtime / вызовы):"]
+        for (filename, line, func), (_, ncalls, tottime, cumtime, _) in rows:
+            location = f"{os.path.basename(filename)}:{line}" if line else filename
+            lines.append(f"{tottime:8.3f} {cumtime:8.3f} {ncalls:7d}  {func} ({location})")
+        return "\n".join(lines)
+
+    def _dump(self, profile, suffix: str, log_func=None) -> Optional[str]:
+        """Сохраняет профиль в файл. Ошибки записи только логируются, чтобы не прерывать обновление."""
+        path = os.path.join(self.output_dir, f"update-{self._run_label}-{suffix}.pstats")
+        stats = profile if isinstance(profile, pstats.Stats) else pstats.Stats(profile)
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stats.dump_stats(path)
+        except OSError as e:
+            self._log(f"Не удалось сохранить профиль в {path}: {e}", log_func)
+            return None
+        return path
+
+    @staticmethod
+    def _log(message, log_func=None):
+        if log_func:
+            log_func(message)
+        else:
+            print(message)
@@ -1,6 +1,7 @@
 
 import os
 import sys
+from typing import Optional
 
 def load_stylesheet(filename: str) -> str:
     """Загружает файл стилей и возвращает его содержимое."""
@@ -20,4 +21,54 @@ def resource_path(relative_path: str) -> str:
     except Exception:
         base_path = os.path.abspath(".")
 
-    return os.path.join(base_path, relative_path)
\ No newline at end of file
+    return os.path.join(base_path, relative_path)
+
+
+def get_process_rss() -> Optional[int]:
+    """Возвращает текущую резидентную память процесса в байтах или None, если измерить не удалось."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    if sys.platform.startswith('win'):
+        return _get_windows_working_set()
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_peak_rss() -> Optional[int]:
+    """Возвращает пиковую резидентную память процесса в байтах (запасной вариант, где текущая недоступна)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # На Linux ru_maxrss в килобайтах, на macOS — в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _get_windows_working_set() -> Optional[int]:
+    """Текущий рабочий набор процесса через GetProcessMemoryInfo (без psutil)."""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize